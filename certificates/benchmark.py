@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2026 beyond-blockchain.org.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import binascii
+import certificate_lib
+import certificates
+import collections
+import datetime
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from bbc1.core import bbclib
+from bbc1.core.message_key_types import KeyType
+
+
+PHASES = ['parse', 'canonicalize', 'digest', 'sign', 'verify', 'fold']
+
+SHAPES = ['flat', 'nested']
+
+SUBJECTS = ['Mathematics', 'English', 'Science', 'History', 'Music']
+
+
+# Stands in for the callback of a BBcAppClient with a single queue.
+class FakeCallback:
+
+    def __init__(self):
+        self.queue = collections.deque()
+
+
+    def synchronize(self, timeout=None):
+        return self.queue.popleft()
+
+
+# Stands in for a BBcAppClient connected to bbc_core with a ledger subsystem.
+# Digests are anchored under one Merkle root per batch, and responses to
+# verification requests are queued as bbc_core would send them.
+class FakeClient:
+
+    def __init__(self):
+        self.callback = FakeCallback()
+        self.subtrees = {}
+        self.query_id = 0
+
+
+    def anchor(self, digests):
+        # Each node of a level is the list of indices of the digests below
+        # it, whose paths to the root are extended level by level.
+        nodes = [[i] for i in range(len(digests))]
+        hashes = list(digests)
+        paths = [[] for digest in digests]
+
+        while len(hashes) > 1:
+            next_nodes = []
+            next_hashes = []
+
+            for i in range(0, len(hashes), 2):
+                if i + 1 >= len(hashes):
+                    next_nodes.append(nodes[i])
+                    next_hashes.append(hashes[i])
+                    continue
+
+                left, right = hashes[i], hashes[i + 1]
+                for j in nodes[i]:
+                    paths[j].append({b'position': b'right',
+                            b'digest': binascii.b2a_hex(right)})
+                for j in nodes[i + 1]:
+                    paths[j].append({b'position': b'left',
+                            b'digest': binascii.b2a_hex(left)})
+
+                next_nodes.append(nodes[i] + nodes[i + 1])
+                next_hashes.append(hashlib.sha256(left + right).digest())
+
+            nodes = next_nodes
+            hashes = next_hashes
+
+        for digest, path in zip(digests, paths):
+            self.subtrees[digest] = path
+
+        return hashes[0] if len(hashes) > 0 else None
+
+
+    def verify_in_ledger_subsystem(self, asset_group_id, digest):
+        self.query_id += 1
+        self.callback.queue.append({
+            KeyType.command: bbclib.MsgType.RESPONSE_VERIFY_HASH_IN_SUBSYS,
+            KeyType.query_id: self.query_id,
+            KeyType.merkle_tree: {
+                b'result': digest in self.subtrees,
+                b'spec': {b'subsystem': b'ethereum'},
+                b'subtree': self.subtrees.get(digest, []),
+            },
+        })
+        return self.query_id
+
+
+def argument_parser():
+    argparser = argparse.ArgumentParser()
+
+    argparser.add_argument('-b', '--batch_size', type=int, default=1000,
+            help='number of certificates per batch (and per Merkle root)')
+    argparser.add_argument('-n', '--counts', type=int, nargs='+',
+            default=[1000], help='numbers of certificates to generate')
+    argparser.add_argument('-o', '--output', type=str, default=None,
+            help='file name to write results in JSON')
+    argparser.add_argument('-p', '--phases', type=str, nargs='+',
+            choices=PHASES, default=PHASES, help='phases to measure')
+    argparser.add_argument('-s', '--shapes', type=str, nargs='+',
+            choices=SHAPES, default=SHAPES, help='shapes of certificates')
+
+    return argparser.parse_args()
+
+
+def get_result(stats, shape, count, batch_size, elapsed, errors):
+
+    phases = {}
+
+    for phase, durations in stats.durations.items():
+        durations = sorted(durations)
+        total = sum(durations)
+        phases[phase] = {
+            'calls': len(durations),
+            'total': total,
+            'per_certificate': total / count,
+            'certificates_per_second': count / total if total > 0 else None,
+            'p50': certificate_lib.get_percentile(durations, 50),
+            'p95': certificate_lib.get_percentile(durations, 95),
+            'p99': certificate_lib.get_percentile(durations, 99),
+        }
+
+    return {
+        'shape': shape,
+        'count': count,
+        'batch_size': batch_size,
+        'elapsed': elapsed,
+        'errors': errors,
+        'phases': phases,
+    }
+
+
+def run_benchmark(file_name, shape, count, batch_size, phases):
+
+    stats = certificate_lib.Stats(is_enabled=True)
+    client = FakeClient()
+    keypair = bbclib.KeyPair()
+    keypair.generate()
+    errors = 0
+    start = time.perf_counter()
+
+    # Batches are processed one after another, as certificates.py does, so
+    # that memory stays bounded at any count.
+    certs = stats.iterate('parse',
+            certificates.read_certificates(file_name, process_multiple=True))
+
+    for batch in certificates.get_batches(certs, batch_size):
+        with stats.measure('canonicalize'):
+            data = [certificate.document.file() for certificate in batch]
+
+        with stats.measure('digest'):
+            digests = [hashlib.sha256(d).digest() for d in data]
+
+        if 'sign' in phases:
+            with stats.measure('sign'):
+                for digest in digests:
+                    keypair.sign(digest)
+
+        if 'verify' not in phases and 'fold' not in phases:
+            continue
+
+        root = client.anchor(digests)
+
+        with stats.measure('verify'):
+            dics = certificates.verify_digests(client, digests)
+
+        if 'fold' in phases:
+            with stats.measure('fold'):
+                roots = [certificate_lib.fold_subtree(digest, dic[b'subtree'])
+                        for digest, dic in zip(digests, dics)]
+
+            errors += sum(1 for r in roots if r != root)
+
+    elapsed = time.perf_counter() - start
+
+    for phase in list(stats.durations.keys()):
+        if phase not in phases:
+            del stats.durations[phase]
+
+    return get_result(stats, shape, count, batch_size, elapsed, errors)
+
+
+def sys_check(args):
+    if args.batch_size < 1:
+        raise ValueError("Error: batch size must be a positive integer.")
+    if any(count < 1 for count in args.counts):
+        raise ValueError("Error: counts must be positive integers.")
+    return
+
+
+def write_certificate(f, shape, i):
+
+    # Similar to sample-m.xml (flat) and sample-nested-s.xml (nested).
+    f.write('<c><id>000-{0:09d}</id><name>Benjamin B. Clark {0}</name>'.format(
+            i))
+
+    if shape == 'flat':
+        f.write('<membership>Fujisawa Don Tacos</membership>'
+                '<date>1559692800</date><expires-at>1906773886</expires-at>')
+
+    else:
+        f.write('<school>Fujisawa Don Tacos School</school>'
+                '<grades container="true">')
+        for j, subject in enumerate(SUBJECTS):
+            f.write('<subject container="true"><year>2020</year>'
+                    '<term>Spring</term><name>{0}</name><point>2</point>'
+                    '<grade random="{1}">A</grade></subject>'.format(subject,
+                    i * len(SUBJECTS) + j))
+        f.write('</grades>')
+
+    f.write('</c>\n')
+
+
+def write_certificates(file_name, shape, count):
+
+    with open(file_name, 'w') as f:
+        f.write('<?xml version="1.0"?>\n<set>\n')
+        for i in range(count):
+            write_certificate(f, shape, i)
+        f.write('</set>\n')
+
+
+if __name__ == '__main__':
+
+    parsed_args = argument_parser()
+
+    try:
+        sys_check(parsed_args)
+
+    except Exception as e:
+        print(str(e))
+        sys.exit(0)
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as dir_name:
+        for shape in parsed_args.shapes:
+            for count in parsed_args.counts:
+                file_name = os.path.join(dir_name,
+                        '{0}-{1}.xml'.format(shape, count))
+                write_certificates(file_name, shape, count)
+
+                results.append(run_benchmark(file_name, shape, count,
+                        parsed_args.batch_size, parsed_args.phases))
+
+                os.remove(file_name)
+                print('{0} {1}: {2:.3f} s'.format(shape, count,
+                        results[-1]['elapsed']), file=sys.stderr)
+
+    report = {
+        'timestamp': datetime.datetime.now(
+                datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    if parsed_args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(parsed_args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(0)
+
+
+# end of benchmark.py
@@ -16,36 +16,383 @@ limitations under the License.
 """
 import bbc1
 import binascii
+import certificate_lib
+import concurrent.futures
 import datetime
 import hashlib
 import io
+import itertools
+import json
 import os
 import string
 import sys
+import threading
 import time
 import urllib.parse
 import xml.etree.ElementTree as ET
 
-from bbc1.core.ethereum import bbc_ethereum
 from bbc1.lib import registry_lib
 from brownie import *
 from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 
 
 S_CONTRACT_ADDRESS = '0xd123Ec03ACdbC36e4fA818c983C259049EE705e0'
 S_NETWORK = 'ropsten'
 
+# Verification results are cached for these seconds (up to this many results).
+S_SUCCESS_TTL = 3600
+S_FAILURE_TTL = 60
+S_RESULT_CACHE_SIZE = 4096
+
+# Rendered pages of verified certificates are kept for S_SUCCESS_TTL seconds
+# (up to this many pages).
+S_PAGE_CACHE_SIZE = 1024
+
+# Certificates in a batch are verified by this many threads, this many at a
+# time.
+S_BATCH_WORKERS = 8
+S_BATCH_CHUNK = 64
+
+# Batches larger than these bytes, with more than this many certificates or
+# with a line longer than these bytes are rejected.
+S_MAX_BATCH_SIZE = 16 * 1024 * 1024
+S_MAX_BATCH_ITEMS = 10000
+S_MAX_LINE_LENGTH = 1024 * 1024
+
+# Asynchronous verifications are done by this many threads, accepting up to
+# this many pending jobs, whose results are kept for these seconds. Pages of
+# pending jobs are reloaded at this interval in seconds.
+S_JOB_WORKERS = 4
+S_MAX_PENDING_JOBS = 256
+S_JOB_TTL = 600
+S_POLL_INTERVAL = 3
+
+# Uploaded files larger than these bytes are rejected. Files are read in
+# chunks of these bytes.
+S_MAX_UPLOAD_SIZE = 1024 * 1024
+S_UPLOAD_CHUNK = 64 * 1024
+
+# Only these keys are taken from an uploaded query string.
+S_QUERY_KEYS = ('certificate', 'subtree')
+
+
+chain_cache = certificate_lib.ChainCache(certificate_lib.F_CHAIN_CACHE)
+eth_pool = certificate_lib.EthereumPool(
+        project_dir=bbc1.__path__[0] + '/core/ethereum')
+result_cache = certificate_lib.TTLCache(size=S_RESULT_CACHE_SIZE)
+page_cache = certificate_lib.TTLCache(size=S_PAGE_CACHE_SIZE)
+root_locks = [threading.Lock() for i in range(64)]
+batch_executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=S_BATCH_WORKERS)
+job_executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=S_JOB_WORKERS)
+jobs = certificate_lib.TTLCache(size=S_MAX_PENDING_JOBS * 4)
+job_slots = threading.BoundedSemaphore(S_MAX_PENDING_JOBS)
+
+
+# Stands in for the input stream of a request, refusing to read more than the
+# limit. Unlike a limit by Content-Length, this holds for chunked requests.
+class LimitedInput:
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.remaining = limit
+
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+    def count(self, data):
+        self.remaining -= len(data)
+        if self.remaining < 0:
+            raise RequestEntityTooLarge()
+        return data
+
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining + 1:
+            size = self.remaining + 1
+        return self.count(self.stream.read(size))
+
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining + 1:
+            size = self.remaining + 1
+        return self.count(self.stream.readline(size))
+
+
+def batch_failure(reason):
+
+    return Response(json.dumps({'result': 'failure', 'reason': reason})
+            + '\n', mimetype='application/x-ndjson')
+
 
 def certify(cert_xml, subtree_string):
 
     if cert_xml is None or subtree_string is None:
         return failure_template('no-query')
 
+    # A verified certificate is rendered once, and its page is served as is
+    # (or revalidated by its ETag) until it expires.
+    etag = get_page_etag(cert_xml, subtree_string)
+    page = page_cache.get(etag)
+
+    if page is None:
+        reason, root, result = verify_certificate(cert_xml, subtree_string)
+
+        if reason is not None:
+            return failure_template(reason, root=root)
+
+        page = (result[2],
+                result_template(reason, root, result).encode('utf-8'))
+        page_cache.put(etag, page, S_SUCCESS_TTL)
+
+    timestamp, html = page
+
+    response = Response(html, mimetype='text/html')
+    response.set_etag(etag)
+    response.last_modified = timestamp
+    response.cache_control.public = True
+    response.cache_control.max_age = S_SUCCESS_TTL
+
+    return response.make_conditional(request)
+
+
+def failure_template(reason, root=''):
+
+    return render_template('cert/failure.html',
+            title='Certificate Verification - Failure',
+            network=S_NETWORK, contract=S_CONTRACT_ADDRESS,
+            reason=reason, root=root,
+            get_date_string=get_date_string)
+
+
+def get_batch_items(request):
+
+    # Items are either lines of query strings in an uploaded file, or lines
+    # of JSON objects with 'certificate' and 'subtree' in the request body.
+    # Raises ValueError if there are more than S_MAX_BATCH_ITEMS items.
+    count = 0
+
+    try:
+        filebuf = request.files.get('file')
+
+    except RequestEntityTooLarge:
+        raise ValueError('too-large')
+
+    if filebuf is not None:
+        for line in read_lines(filebuf.stream):
+            try:
+                dic = urllib.parse.parse_qs(line.decode('utf-8').strip())
+
+            except UnicodeDecodeError:
+                dic = {'certificate': [None]}
+
+            if 'certificate' not in dic and 'subtree' not in dic:
+                continue
+
+            count += 1
+            if count > S_MAX_BATCH_ITEMS:
+                raise ValueError('too-large')
+
+            yield (dic['certificate'][0] if 'certificate' in dic else None,
+                    dic['subtree'][0] if 'subtree' in dic else None)
+        return
+
+    for line in read_lines(request.stream):
+        line = line.strip()
+        if len(line) <= 0:
+            continue
+
+        count += 1
+        if count > S_MAX_BATCH_ITEMS:
+            raise ValueError('too-large')
+
+        try:
+            dic = json.loads(line.decode('utf-8'))
+
+        except ValueError:
+            dic = None
+
+        if not isinstance(dic, dict):
+            yield (None, None)
+            continue
+
+        yield (dic.get('certificate'), dic.get('subtree'))
+
+
+def get_batch_result(index, item):
+
+    try:
+        reason, root, result = verify_certificate(*item)
+
+    except Exception as error:
+        return {
+            'index': index,
+            'id': 'N/A',
+            'result': 'failure',
+            'reason': 'error',
+            'description': str(error),
+        }
+
+    dic = {
+        'index': index,
+        'id': 'N/A' if root == '' else root.findtext('id', default='N/A'),
+    }
+
+    if reason is not None:
+        dic['result'] = 'failure'
+        dic['reason'] = reason
+        return dic
+
+    block_no, digest0, timestamp = result
+
+    dic['result'] = 'success'
+    dic['network'] = S_NETWORK
+    dic['contract_address'] = S_CONTRACT_ADDRESS
+    dic['block'] = block_no
+    dic['root'] = binascii.b2a_hex(digest0).decode()
+    dic['time'] = timestamp
+    return dic
+
+
+def get_date_string(timestamp):
+
+    try:
+        s = str(datetime.datetime.fromtimestamp(int(timestamp))).split()
+
+    except ValueError:
+        return 'N/A'
+
+    return s[0]
+
+
+def get_page_etag(cert_xml, subtree_string):
+
+    # The page depends on nothing but the query (the network and contract
+    # being fixed), so it is identified without parsing the certificate.
+    return hashlib.sha256(cert_xml.encode('utf-8') + b'\0'
+            + subtree_string.encode('utf-8')).hexdigest()
+
+
+def limit_input(request, limit):
+
+    # Reading more than the limit from the body raises RequestEntityTooLarge.
+    # To be called before the body is accessed.
+    request.environ['wsgi.input'] = LimitedInput(
+            request.environ['wsgi.input'], limit)
+
+
+def read_lines(stream):
+
+    # Yields lines of the stream. Raises ValueError if a line is longer than
+    # S_MAX_LINE_LENGTH or the request is larger than its limit.
+    while True:
+        try:
+            line = stream.readline(S_MAX_LINE_LENGTH + 1)
+
+        except RequestEntityTooLarge:
+            raise ValueError('too-large')
+
+        if len(line) <= 0:
+            return
+
+        if len(line.rstrip(b'\r\n')) > S_MAX_LINE_LENGTH:
+            raise ValueError('too-large')
+
+        yield line
+
+
+def read_query(stream):
+
+    # Parses a query string in chunks, keeping only the first value of each
+    # of S_QUERY_KEYS. Raises ValueError if too large or not in UTF-8.
+    dic = {}
+    parts = []
+    size = 0
+
+    while True:
+        chunk = stream.read(S_UPLOAD_CHUNK)
+        if len(chunk) <= 0:
+            break
+
+        size += len(chunk)
+        if size > S_MAX_UPLOAD_SIZE:
+            raise ValueError('too-large')
+
+        pairs = chunk.split(b'&')
+        parts.append(pairs[0])
+
+        for pair in pairs[1:]:
+            read_query_pair(dic, b''.join(parts))
+            parts = [pair]
+
+    read_query_pair(dic, b''.join(parts))
+
+    return dic
+
+
+def read_query_pair(dic, pair):
+
+    try:
+        s = pair.decode('utf-8').strip()
+
+    except UnicodeDecodeError:
+        raise ValueError('bad-upload')
+
+    for key, value in urllib.parse.parse_qsl(s):
+        if key in S_QUERY_KEYS and key not in dic:
+            dic[key] = value
+
+
+def result_template(reason, root, result):
+
+    if reason is not None:
+        return failure_template(reason, root=root)
+
+    block_no, digest0, timestamp = result
+
+    realtime = datetime.datetime.fromtimestamp(timestamp)
+
+    return render_template('cert/success.html',
+            title='Certificate Vefirication - Success',
+            root=root, network=S_NETWORK, contract=S_CONTRACT_ADDRESS,
+            block_no=block_no, realtime=realtime,
+            get_date_string=get_date_string,
+            merkle_root=binascii.b2a_hex(digest0).decode())
+
+
+def submit_job(cert_xml, subtree_string):
+
+    # Returns None if there are too many pending jobs.
+    if not job_slots.acquire(blocking=False):
+        return None
+
+    future = job_executor.submit(verify_certificate, cert_xml,
+            subtree_string)
+    future.add_done_callback(lambda f: job_slots.release())
+
+    job_id = binascii.b2a_hex(os.urandom(16)).decode()
+    jobs.put(job_id, future, S_JOB_TTL)
+
+    return job_id
+
+
+def verify_certificate(cert_xml, subtree_string):
+
+    # Returns the reason of failure (None if verified), the root element of
+    # the certificate ('' if not parsed) and the result from the chain.
+    if cert_xml is None or subtree_string is None:
+        return 'no-query', '', None
+
     try:
         root = ET.fromstring(cert_xml)
 
     except ET.ParseError:
-        return failure_template('xml-syntax')
+        return 'xml-syntax', '', None
 
     try:
         data = registry_lib.file(root)
@@ -53,12 +400,13 @@ def certify(cert_xml, subtree_string):
     except ValueError as error:
         s = str(error)
         if s.startswith('pubkey'):
-            return failure_template('no-pubkey', root=root)
+            return 'no-pubkey', root, None
         elif s.startswith('sig'):
-            return failure_template('bad-sig', root=root)
+            return 'bad-sig', root, None
+        raise
 
     except KeyError as error:
-        return failure_template('sig-algo', root=root)
+        return 'sig-algo', root, None
 
     digest = hashlib.sha256(data).digest()
 
@@ -68,54 +416,68 @@ def certify(cert_xml, subtree_string):
     for node in nodes:
         s = node.split('-')
         if len(s) != 2 or not all(c in string.hexdigits for c in s[1]):
-            return failure_template('subtree-syntax', root=root)
+            return 'subtree-syntax', root, None
         dic = {}
         dic['position'] = 'right' if s[0] == 'r' else 'left'
         dic['digest'] = s[1]
         subtree.append(dic)
 
-    eth = bbc_ethereum.BBcEthereum(
-        S_NETWORK,
-        private_key=None,
-        contract_address=S_CONTRACT_ADDRESS,
-        project_dir=bbc1.__path__[0] + '/core/ethereum'
-    )
+    key = (digest, tuple((dic['position'], dic['digest'].lower())
+            for dic in subtree))
+    result = result_cache.get(key)
 
-    block_no, digest0 = eth.verify_and_get_root(digest, subtree)
+    if result is None:
+        block_no, digest0 = verify_in_ethereum(digest, subtree)
 
-    if block_no <= 0:
-        return failure_template('digest-mismatch', root=root)
+        if block_no <= 0:
+            result = (block_no, digest0, None)
+            result_cache.put(key, result, S_FAILURE_TTL)
 
-    block = network.web3.eth.getBlock(block_no)
+        else:
+            result = (block_no, digest0,
+                    chain_cache.get_timestamp(S_NETWORK, block_no))
+            result_cache.put(key, result, S_SUCCESS_TTL)
 
-    realtime = datetime.datetime.fromtimestamp(block['timestamp'])
+    if result[0] <= 0:
+        return 'digest-mismatch', root, None
 
-    return render_template('cert/success.html',
-            title='Certificate Vefirication - Success',
-            root=root, network=S_NETWORK, contract=S_CONTRACT_ADDRESS,
-            block_no=block_no, realtime=realtime,
-            get_date_string=get_date_string,
-            merkle_root=binascii.b2a_hex(digest0).decode())
+    return None, root, result
 
 
-def failure_template(reason, root=''):
+def verify_in_ethereum(digest, subtree):
 
-    return render_template('cert/failure.html',
-            title='Certificate Verification - Failure',
-            network=S_NETWORK, contract=S_CONTRACT_ADDRESS,
-            reason=reason, root=root,
-            get_date_string=get_date_string)
+    root = certificate_lib.fold_subtree(digest, subtree)
 
+    # Ethereum is used only if the Merkle root is not known to be anchored.
+    if chain_cache.get_root_block_no(S_NETWORK, S_CONTRACT_ADDRESS,
+            root) is not None:
+        return chain_cache.verify(None, S_NETWORK, S_CONTRACT_ADDRESS, digest,
+                subtree)
 
-def get_date_string(timestamp):
+    # Concurrent verifications under the same Merkle root wait for the first
+    # one to look it up, and then find it in the cache.
+    with root_locks[root[0] % len(root_locks)]:
+        return verify_in_ethereum_with_retry(digest, subtree, root)
 
-    try:
-        s = str(datetime.datetime.fromtimestamp(int(timestamp))).split()
 
-    except ValueError:
-        return 'N/A'
+def verify_in_ethereum_with_retry(digest, subtree, root):
 
-    return s[0]
+    if chain_cache.get_root_block_no(S_NETWORK, S_CONTRACT_ADDRESS,
+            root) is not None:
+        return chain_cache.verify(None, S_NETWORK, S_CONTRACT_ADDRESS, digest,
+                subtree)
+
+    try:
+        return chain_cache.verify(
+                eth_pool.get(S_NETWORK, S_CONTRACT_ADDRESS), S_NETWORK,
+                S_CONTRACT_ADDRESS, digest, subtree)
+
+    except Exception:
+        # The connection may have been lost; retry once with a new handle.
+        eth_pool.invalidate()
+        return chain_cache.verify(
+                eth_pool.get(S_NETWORK, S_CONTRACT_ADDRESS), S_NETWORK,
+                S_CONTRACT_ADDRESS, digest, subtree)
 
 
 cert = Blueprint('cert', __name__, template_folder='templates',
@@ -131,23 +493,123 @@ def index():
     return certify(cert_xml, subtree_string)
 
 
+@cert.route('/batch', methods=['POST'])
+def batch():
+
+    # The limit of size is enforced while the body is read, as a chunked
+    # request does not tell its length in advance.
+    limit_input(request, S_MAX_BATCH_SIZE)
+
+    if request.content_length is not None \
+            and request.content_length > S_MAX_BATCH_SIZE:
+        return batch_failure('too-large'), 413
+
+    # The first chunk is read before responding, so that a batch found too
+    # large there is rejected with 413. Later, the response ends with a line
+    # of the failure instead.
+    items = get_batch_items(request)
+
+    try:
+        chunk = list(itertools.islice(items, S_BATCH_CHUNK))
+
+    except ValueError as error:
+        return batch_failure(str(error)), 413
+
+    def generate(chunk):
+        index = 0
+
+        while len(chunk) > 0:
+            for dic in batch_executor.map(get_batch_result,
+                    range(index, index + len(chunk)), chunk):
+                yield json.dumps(dic) + '\n'
+
+            index += len(chunk)
+
+            try:
+                chunk = list(itertools.islice(items, S_BATCH_CHUNK))
+
+            except ValueError as error:
+                yield json.dumps({
+                    'index': index,
+                    'result': 'failure',
+                    'reason': str(error),
+                }) + '\n'
+                return
+
+    return Response(stream_with_context(generate(chunk)),
+            mimetype='application/x-ndjson')
+
+
+@cert.route('/job/<job_id>')
+def job(job_id):
+
+    future = jobs.get(job_id)
+
+    if future is None:
+        return failure_template('no-job')
+
+    if not future.done():
+        return render_template('cert/pending.html',
+                title='Certificate Verification - Pending',
+                network=S_NETWORK, contract=S_CONTRACT_ADDRESS,
+                interval=S_POLL_INTERVAL)
+
+    if future.exception() is not None:
+        return failure_template('error')
+
+    return result_template(*future.result())
+
+
+@cert.route('/submit', methods=['GET', 'POST'])
+def submit():
+
+    cert_xml = request.values.get('certificate')
+    subtree_string = request.values.get('subtree')
+
+    if cert_xml is None or subtree_string is None:
+        return failure_template('no-query')
+
+    job_id = submit_job(cert_xml, subtree_string)
+
+    if job_id is None:
+        return failure_template('busy')
+
+    return redirect(url_for('cert.job', job_id=job_id))
+
+
 @cert.route('/upload', methods=['GET', 'POST'])
 def upload():
 
     if request.method == 'POST':
-        filebuf = request.files.get('file')
+        # Oversized requests are rejected before the body is read, allowing
+        # some bytes for multipart headers. As a chunked request does not
+        # tell its length in advance, the limit is also enforced while the
+        # body is read.
+        limit_input(request, S_MAX_UPLOAD_SIZE + 4096)
+
+        if request.content_length is not None \
+                and request.content_length > S_MAX_UPLOAD_SIZE + 4096:
+            return failure_template('too-large'), 413
+
+        try:
+            filebuf = request.files.get('file')
+
+        except RequestEntityTooLarge:
+            return failure_template('too-large'), 413
+
         if filebuf is None:
             flash('no file')
             return redirect(request.url)
 
-        s = filebuf.stream.read()
-
-        dic = urllib.parse.parse_qs(s.decode('utf-8'))
+        try:
+            dic = read_query(filebuf.stream)
 
-        l_cert_xml = dic['certificate'] if 'certificate' in dic else None
-        l_subtree_string = dic['subtree'] if 'subtree' in dic else None
+        except ValueError as error:
+            reason = str(error)
+            return failure_template(reason), \
+                    413 if reason == 'too-large' else 400
 
-        return certify(l_cert_xml[0], l_subtree_string[0])
+        return certify(dic.get('certificate'), dic.get('subtree'))
 
     return '''
 <!doctype html>
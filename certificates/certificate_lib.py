@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2026 beyond-blockchain.org.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import binascii
+import collections
+import contextlib
+import hashlib
+import math
+import sqlite3
+import sys
+import threading
+import time
+
+from bbc1.core.ethereum import bbc_ethereum
+from brownie import network
+
+
+F_CHAIN_CACHE = 'chain_cache.sqlite'
+F_JOURNAL     = 'registration_journal.sqlite'
+
+EXT_DIGESTS = '.digests.sqlite'
+
+DEFAULT_CACHE_SIZE = 4096
+
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+
+# States of a certificate in the registration journal.
+STATE_DOCUMENT = 'document'  # registered to registry_lib
+STATE_DONE     = 'done'      # registered to the ledger subsystem as well
+
+
+# Facts read from the chain that never change once they are there: the
+# timestamp of a block, and the block at which a Merkle root is anchored.
+# They are kept in SQLite and, for recent ones, in memory.
+class ChainCache:
+
+    def __init__(self, path, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self.recent = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            'create table if not exists block_table ('
+            'network TEXT, block_no INTEGER, timestamp INTEGER, '
+            'primary key (network, block_no))'
+        )
+        self.db.execute(
+            'create table if not exists root_table ('
+            'network TEXT, contract_address TEXT, root BLOB, '
+            'block_no INTEGER, primary key (network, contract_address, root))'
+        )
+        self.db.commit()
+
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+    def get_root_block_no(self, network_name, contract_address, root):
+        key = ('root', network_name, contract_address, root)
+
+        with self.lock:
+            if key in self.recent:
+                self.recent.move_to_end(key)
+                return self.recent[key]
+
+            row = self.db.execute(
+                'select block_no from root_table '
+                'where network=? and contract_address=? and root=?',
+                key[1:]
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        self.remember(key, row[0])
+        return row[0]
+
+
+    def get_timestamp(self, network_name, block_no):
+        key = ('block', network_name, block_no)
+
+        with self.lock:
+            if key in self.recent:
+                self.recent.move_to_end(key)
+                return self.recent[key]
+
+            row = self.db.execute(
+                'select timestamp from block_table '
+                'where network=? and block_no=?',
+                key[1:]
+            ).fetchone()
+
+        if row is None:
+            timestamp = network.web3.eth.getBlock(block_no)['timestamp']
+
+            with self.lock:
+                self.db.execute(
+                    'insert or replace into block_table values (?, ?, ?)',
+                    (network_name, block_no, timestamp)
+                )
+                self.db.commit()
+
+        else:
+            timestamp = row[0]
+
+        self.remember(key, timestamp)
+        return timestamp
+
+
+    def put_root_block_no(self, network_name, contract_address, root,
+            block_no):
+        with self.lock:
+            self.db.execute(
+                'insert or replace into root_table values (?, ?, ?, ?)',
+                (network_name, contract_address, root, block_no)
+            )
+            self.db.commit()
+
+        self.remember(('root', network_name, contract_address, root),
+                block_no)
+
+
+    def remember(self, key, value):
+        with self.lock:
+            self.recent[key] = value
+            self.recent.move_to_end(key)
+            if len(self.recent) > self.size:
+                self.recent.popitem(last=False)
+
+
+    def verify(self, eth, network_name, contract_address, digest, subtree):
+        # The Merkle root is folded locally; only a root that is not known
+        # to be anchored yet is looked up at the contract.
+        root = fold_subtree(digest, subtree)
+        block_no = self.get_root_block_no(network_name, contract_address,
+                root)
+
+        if block_no is None:
+            block_no, root = eth.verify_and_get_root(digest, subtree)
+            if block_no > 0:
+                self.get_timestamp(network_name, block_no)
+                self.put_root_block_no(network_name, contract_address, root,
+                        block_no)
+
+        return block_no, root
+
+
+# Digests of certificates keyed by their ids and the SHA-256 of their XML, so
+# that each certificate is canonicalized only once over runs on the same file.
+# They are kept in SQLite, so that memory stays constant at any number of
+# certificates. Without a path, nothing is kept.
+class DigestCache:
+
+    def __init__(self, path=None, stats=None):
+        self.stats = Stats() if stats is None else stats
+        self.db = None
+
+        if path is None:
+            return
+
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'create table if not exists digest_table ('
+            'certificate_id TEXT, content_hash BLOB, digest BLOB, '
+            'primary key (certificate_id, content_hash))'
+        )
+        self.db.commit()
+
+
+    def close(self):
+        if self.db is None:
+            return
+
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+
+    def get_digest(self, certificate):
+
+        if self.db is None:
+            return self.make_digest(certificate)
+
+        key = (certificate.id, hashlib.sha256(
+                certificate.get_xml().encode('utf-8')).digest())
+
+        row = self.db.execute(
+            'select digest from digest_table '
+            'where certificate_id=? and content_hash=?',
+            key
+        ).fetchone()
+
+        if row is not None:
+            return row[0]
+
+        digest = self.make_digest(certificate)
+        self.db.execute(
+            'insert or replace into digest_table values (?, ?, ?)',
+            key + (digest,)
+        )
+
+        return digest
+
+
+    def make_digest(self, certificate):
+        with self.stats.measure('canonicalize'):
+            return hashlib.sha256(certificate.document.file()).digest()
+
+
+# BBcEthereum handles shared by all threads of a process. A handle is made on
+# first use, and made again if the connection to the network is found broken
+# (checked at most once per interval) or the handle is invalidated after an
+# error. As brownie connects a process to one network at a time, there is one
+# handle per contract rather than a pool of connections.
+class EthereumPool:
+
+    def __init__(self, project_dir=None,
+            interval=DEFAULT_HEALTH_CHECK_INTERVAL):
+        self.project_dir = project_dir
+        self.interval = interval
+        self.handles = {}
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+
+    def get(self, network_name, contract_address, private_key=None):
+        key = (network_name, contract_address)
+
+        with self.lock:
+            now = time.time()
+
+            if len(self.handles) > 0 and now - self.checked_at >= self.interval:
+                self.checked_at = now
+                if not is_connected():
+                    self.reset()
+
+            if key not in self.handles:
+                if network.is_connected() and len(self.handles) <= 0:
+                    network.disconnect()
+
+                self.handles[key] = bbc_ethereum.BBcEthereum(
+                    network_name,
+                    private_key=private_key,
+                    contract_address=contract_address,
+                    project_dir=self.project_dir
+                )
+                self.checked_at = now
+
+            return self.handles[key]
+
+
+    def invalidate(self):
+        with self.lock:
+            self.reset()
+
+
+    def reset(self):
+        self.handles.clear()
+        if network.is_connected():
+            network.disconnect()
+
+
+# Records how far each certificate (by its id and document digest) has gone
+# through registration, so that an interrupted run can be resumed.
+class RegistrationJournal:
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'create table if not exists journal_table ('
+            'certificate_id TEXT, digest BLOB, state TEXT, '
+            'timestamp INTEGER, primary key (certificate_id, digest))'
+        )
+        self.db.commit()
+
+
+    def close(self):
+        self.db.close()
+
+
+    def get_state(self, certificate_id, digest):
+        row = self.db.execute(
+            'select state from journal_table '
+            'where certificate_id=? and digest=?',
+            (certificate_id, digest)
+        ).fetchone()
+
+        return None if row is None else row[0]
+
+
+    def set_states(self, entries, state):
+        timestamp = int(time.time())
+        self.db.executemany(
+            'insert or replace into journal_table values (?, ?, ?, ?)',
+            [(certificate_id, digest, state, timestamp)
+                    for certificate_id, digest in entries]
+        )
+        self.db.commit()
+
+
+# Wall time spent in each phase of processing. Measurement does nothing
+# unless enabled.
+class Stats:
+
+    BUCKETS = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0]
+
+    def __init__(self, is_enabled=False):
+        self.is_enabled = is_enabled
+        self.durations = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+
+
+    def iterate(self, phase, iterable):
+        iterator = iter(iterable)
+
+        while True:
+            with self.measure(phase):
+                try:
+                    item = next(iterator)
+
+                except StopIteration:
+                    return
+
+            yield item
+
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        if not self.is_enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.durations.setdefault(phase, []).append(duration)
+
+
+    def print_summary(self, count, file=None):
+        if not self.is_enabled:
+            return
+
+        if file is None:
+            file = sys.stderr
+
+        elapsed = time.time() - self.start_time
+
+        print("{0} certificates in {1:.3f} s ({2:.1f} certificates/s)".format(
+                count, elapsed, count / elapsed if elapsed > 0 else 0),
+                file=file)
+
+        for phase, durations in self.durations.items():
+            durations = sorted(durations)
+
+            print("{0}: {1} calls, total {2:.3f} s, p50 {3}, p95 {4}, "
+                    "p99 {5}".format(phase, len(durations), sum(durations),
+                    format_duration(get_percentile(durations, 50)),
+                    format_duration(get_percentile(durations, 95)),
+                    format_duration(get_percentile(durations, 99))),
+                    file=file)
+
+            counts = [0] * (len(Stats.BUCKETS) + 1)
+            for duration in durations:
+                i = 0
+                while i < len(Stats.BUCKETS) and duration >= Stats.BUCKETS[i]:
+                    i += 1
+                counts[i] += 1
+
+            for i, n in enumerate(counts):
+                if n <= 0:
+                    continue
+                label = '< ' + format_duration(Stats.BUCKETS[i]) \
+                        if i < len(Stats.BUCKETS) \
+                        else '>= ' + format_duration(Stats.BUCKETS[-1])
+                print("  {0:>9} {1:>8} {2}".format(label, n,
+                        '#' * math.ceil(50 * n / len(durations))), file=file)
+
+
+# Size-bounded cache whose entries expire after their time-to-live. The least
+# recently used entry is evicted when the cache is full.
+class TTLCache:
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            expires_at, value = self.entries[key]
+            if expires_at <= time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+
+    def put(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+def fold_subtree(digest, subtree):
+    # Directives come from BBc-1 core with bytes keys and values, or are
+    # parsed from a query string with str ones.
+    for directive in subtree:
+        position = get_text(directive, 'position')
+        sibling = binascii.a2b_hex(get_text(directive, 'digest'))
+
+        if position == 'right':
+            digest = hashlib.sha256(digest + sibling).digest()
+        else:
+            digest = hashlib.sha256(sibling + digest).digest()
+
+    return digest
+
+
+def format_duration(seconds):
+    if seconds < 1e-3:
+        return '{0:.0f}us'.format(seconds * 1e6)
+    if seconds < 1.0:
+        return '{0:.1f}ms'.format(seconds * 1e3)
+    return '{0:.2f}s'.format(seconds)
+
+
+def get_percentile(sorted_values, percent):
+    i = math.ceil(len(sorted_values) * percent / 100) - 1
+    return sorted_values[max(i, 0)]
+
+
+def get_text(directive, key):
+    value = directive[key] if key in directive else directive[key.encode()]
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def is_connected():
+    try:
+        return network.is_connected() and network.web3.isConnected()
+
+    except Exception:
+        return False
+
+
+# end of certificate_lib.py
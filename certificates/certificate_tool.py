@@ -16,7 +16,10 @@ limitations under the License.
 """
 import argparse
 import binascii
+import concurrent.futures
 import hashlib
+import json
+import os
 import sys
 import urllib.parse
 import xml.etree.ElementTree as ET
@@ -25,6 +28,16 @@ from bbc1.core import bbclib
 from bbc1.lib import registry_lib
 
 
+S_ALGO = 'ecdsa-p256v1'
+
+# Elements are passed to signing processes this many at a time.
+S_SIGN_CHUNK = 64
+
+
+# keypair used by a signing process
+signer = None
+
+
 def argument_parser():
     argparser = argparse.ArgumentParser()
     subparsers = argparser.add_subparsers(dest="command_type", help='commands')
@@ -38,16 +51,30 @@ def argument_parser():
     # digest command
     parser = subparsers.add_parser('digest',
             help='Get <digest/> element')
+    parser.add_argument('-a', '--all', action='store_true',
+            help='get <digest/> elements of all containers in the document')
     parser.add_argument('xml_string', action='store', default=None,
             help='XML string to get SHA-256 digest of (or .xml file name)')
 
     # keypair command
     parser = subparsers.add_parser('keypair',
             help='Generate a keypair')
+    parser.add_argument('-c', '--count', type=int, default=None,
+            help='number of keypairs to generate into a JSON array')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+            help='number of generating processes (with -c)')
+    parser.add_argument('-o', '--output', type=str, default=None,
+            help='file name to write keypairs (with -c)')
 
     # sign command
     parser = subparsers.add_parser('sign',
             help='Sign a document')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+            help='number of signing processes (with -m)')
+    parser.add_argument('-m', '--multiple', action='store_true',
+            help='sign each child element of the document')
+    parser.add_argument('-o', '--output', type=str, default=None,
+            help='file name to write signed documents (with -m)')
     parser.add_argument('xml_string', action='store', default=None,
             help='Document XML string (or .xml file name)')
 
@@ -64,6 +91,96 @@ def generate_keypair():
     return
 
 
+def generate_keypair_dict(i):
+    keypair = bbclib.KeyPair()
+    keypair.generate()
+    return {
+        'pubkey': binascii.b2a_hex(keypair.public_key).decode(),
+        'privkey': binascii.b2a_hex(keypair.private_key).decode()
+    }
+
+
+def generate_keypairs(count, output=None, jobs=None):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) \
+            as executor:
+        keypairs = list(executor.map(generate_keypair_dict, range(count),
+                chunksize=max(count // (4 * (jobs or 1)), 1)))
+
+    if output is None:
+        print(json.dumps(keypairs, indent=2))
+    else:
+        with open(output, 'w') as f:
+            json.dump(keypairs, f, indent=2)
+
+
+def get_container_digests(e, path, entries, is_replaceable=True):
+    # Appends [path, digest] of each container at or below e in document
+    # order, and returns the digest of e if it is a container. Containers
+    # below a container are replaced by their <digest/> elements once
+    # digested, so that each element is canonicalized only once. This is done
+    # only in containers reached through containers alone (is_replaceable),
+    # as an element that is not a container is hashed as raw bytes with all
+    # its descendants.
+    is_container = is_container_element(e)
+    is_replaceable = is_replaceable and is_container
+
+    if is_container:
+        entry = [path, None]
+        entries.append(entry)
+
+    counts = {}
+    for child in e:
+        counts[child.tag] = counts.get(child.tag, 0) + 1
+
+    indices = {}
+    for i, child in enumerate(list(e)):
+        child_path = '{0}/{1}'.format(path, child.tag)
+        if counts[child.tag] > 1:
+            indices[child.tag] = indices.get(child.tag, 0) + 1
+            child_path += '[{0}]'.format(indices[child.tag])
+
+        digest = get_container_digests(child, child_path, entries,
+                is_replaceable)
+
+        if is_replaceable and digest is not None:
+            d = ET.Element('digest')
+            d.text = binascii.b2a_hex(digest).decode()
+            d.tail = child.tail
+            e[i] = d
+
+    if not is_container:
+        return None
+
+    entry[1] = hashlib.sha256(registry_lib.file(e)).digest()
+    return entry[1]
+
+
+def get_keypair(private_key, file=None):
+    if file is None:
+        file = sys.stdout
+
+    if private_key is not None:
+        return bbclib.KeyPair(privkey=binascii.a2b_hex(private_key))
+
+    keypair = bbclib.KeyPair()
+    keypair.generate()
+    print('Keep this privately:', file=file)
+    print('private key : {0}'.format(
+            binascii.b2a_hex(keypair.private_key).decode()), file=file)
+    print('', file=file)
+    return keypair
+
+
+def init_signer(private_key):
+    global signer
+    signer = bbclib.KeyPair(privkey=private_key)
+
+
+def is_container_element(e):
+    return 'container' in e.attrib and e.attrib['container'] == 'true' \
+            and len(e) > 0
+
+
 def print_digest(xml_string, url_encode):
     if xml_string.endswith('.xml'):
         tree = ET.parse(xml_string)
@@ -73,8 +190,7 @@ def print_digest(xml_string, url_encode):
         s = xml_string.encode('utf-8')
         e = ET.fromstring(s)
 
-    if 'container' in e.attrib and e.attrib['container'] == 'true' \
-            and len(e) > 0:
+    if is_container_element(e):
         digest = hashlib.sha256(registry_lib.file(e)).digest()
     else:
         digest = hashlib.sha256(s).digest()
@@ -83,17 +199,23 @@ def print_digest(xml_string, url_encode):
     print(urllib.parse.quote(sD, safe='') if url_encode else sD)
 
 
-def sign_document(xml_string, private_key):
-    if private_key is None:
-        keypair = bbclib.KeyPair()
-        keypair.generate()
-        print('Keep this privately:')
-        print('private key : {0}'.format(
-                binascii.b2a_hex(keypair.private_key).decode()))
-        print('')
-
+def print_digests(xml_string, url_encode):
+    if xml_string.endswith('.xml'):
+        e = ET.parse(xml_string).getroot()
     else:
-        keypair = bbclib.KeyPair(privkey=binascii.a2b_hex(private_key))
+        e = ET.fromstring(xml_string.encode('utf-8'))
+
+    entries = []
+    get_container_digests(e, '/' + e.tag, entries)
+
+    for path, digest in entries:
+        sD = '<digest>{0}</digest>'.format(binascii.b2a_hex(digest).decode())
+        print('{0} : {1}'.format(path,
+                urllib.parse.quote(sD, safe='') if url_encode else sD))
+
+
+def sign_document(xml_string, private_key):
+    keypair = get_keypair(private_key)
 
     if xml_string.endswith('.xml'):
         tree = ET.parse(xml_string)
@@ -107,12 +229,54 @@ def sign_document(xml_string, private_key):
     sig = keypair.sign(digest)
 
     print('Put the following as attributes of your XML document root:')
-    print('algo="{0}"'.format('ecdsa-p256v1'))
+    print('algo="{0}"'.format(S_ALGO))
     print('sig="{0}"'.format(binascii.b2a_hex(sig).decode()))
     print('pubkey="{0}"'.format(binascii.b2a_hex(keypair.public_key).decode()))
 
 
+def sign_documents(file_name, private_key, output=None, jobs=None):
+    # The private key, if generated, goes to stderr, as the signed documents
+    # may go to stdout.
+    keypair = get_keypair(private_key, file=sys.stderr)
+    pubkey = binascii.b2a_hex(keypair.public_key).decode()
+
+    tree = ET.parse(file_name)
+    elements = list(tree.getroot())
+
+    # Elements are canonicalized and signed in processes that each load the
+    # keypair once.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+            initializer=init_signer,
+            initargs=(keypair.private_key,)) as executor:
+        sigs = executor.map(sign_element,
+                [ET.tostring(e, encoding='utf-8') for e in elements],
+                chunksize=S_SIGN_CHUNK)
+
+        for e, sig in zip(elements, sigs):
+            e.set('algo', S_ALGO)
+            e.set('sig', binascii.b2a_hex(sig).decode())
+            e.set('pubkey', pubkey)
+
+    if output is None:
+        tree.write(sys.stdout, encoding='unicode')
+        print('')
+    else:
+        tree.write(output, encoding='utf-8', xml_declaration=True)
+
+
+def sign_element(xml_string):
+    e = ET.fromstring(xml_string)
+    return signer.sign(hashlib.sha256(registry_lib.file(e)).digest())
+
+
 def sys_check(args):
+    if getattr(args, 'count', None) is not None and args.count < 1:
+        raise ValueError("Error: count must be a positive integer.")
+    if getattr(args, 'jobs', 1) < 1:
+        raise ValueError("Error: number of jobs must be a positive integer.")
+    if getattr(args, 'multiple', False) \
+            and not args.xml_string.endswith('.xml'):
+        raise ValueError("Error: -m requires an .xml file name.")
     return
 
 
@@ -128,13 +292,24 @@ if __name__ == '__main__':
         sys.exit(0)
 
     if parsed_args.command_type == 'digest':
-        print_digest(parsed_args.xml_string, parsed_args.url_encode)
+        if parsed_args.all:
+            print_digests(parsed_args.xml_string, parsed_args.url_encode)
+        else:
+            print_digest(parsed_args.xml_string, parsed_args.url_encode)
 
     elif parsed_args.command_type == 'keypair':
-        generate_keypair()
+        if parsed_args.count is None:
+            generate_keypair()
+        else:
+            generate_keypairs(parsed_args.count, output=parsed_args.output,
+                    jobs=parsed_args.jobs)
 
     elif parsed_args.command_type == 'sign':
-        sign_document(parsed_args.xml_string, parsed_args.private_key)
+        if parsed_args.multiple:
+            sign_documents(parsed_args.xml_string, parsed_args.private_key,
+                    output=parsed_args.output, jobs=parsed_args.jobs)
+        else:
+            sign_document(parsed_args.xml_string, parsed_args.private_key)
 
     sys.exit(0)
 
@@ -17,10 +17,15 @@ limitations under the License.
 import argparse
 import bbc1
 import binascii
+import certificate_lib
+import concurrent.futures
+import contextlib
 import datetime
-import hashlib
 import json
 import os
+import shlex
+import socket
+import sqlite3
 import sys
 import time
 import urllib
@@ -40,6 +45,10 @@ F_JSON_REG_INFO = 'certificate_registry_info.json'
 KEY_REGISTRY = 'registry'
 KEY_USER     = 'user'
 
+MAX_DIRECTIVES = 65536
+
+SOCKET_TIMEOUT = 30  # seconds to wait for a client to send or take a line
+
 
 class Certificate:
 
@@ -50,16 +59,24 @@ class Certificate:
             document_id=bbclib.get_new_id(self.id, include_timestamp=False),
             root=root
         )
+        self.xml = None
+
+
+    def get_xml(self):
+
+        if self.xml is None:
+            self.xml = ET.tostring(self.document.root,
+                    encoding='utf-8').decode('utf-8')
+
+        return self.xml
 
 
 class Certifier:
 
     def __init__(self, is_test=False, is_verbose=False,
             domain_id_string=None,
-            workingdir=bbc_config.DEFAULT_WORKING_DIR):
-
-        self.is_test = is_test
-        self.is_verbose = is_verbose
+            workingdir=bbc_config.DEFAULT_WORKING_DIR,
+            digest_file=None, is_profiling=False):
 
         if domain_id_string is None:
             self.domain_id = None
@@ -68,11 +85,22 @@ class Certifier:
             self.domain_id = bytes(binascii.a2b_hex(domain_id_string))
 
         self.workingdir = workingdir
+        self.ethereums = {}
+        self.eth_config = None
+        self.directives = {}
+        self.start_run(is_test=is_test, is_verbose=is_verbose,
+                digest_file=digest_file, is_profiling=is_profiling)
         self.run_client()
 
         self.dic = read_dic(self.domain_id)
         self.idPubkeyMap = id_lib.BBcIdPublickeyMap(self.domain_id)
         self.registry = self.get_registry()
+        self.chainCache = certificate_lib.ChainCache(
+                app_support_lib.get_support_dir(self.domain_id)
+                + certificate_lib.F_CHAIN_CACHE)
+        self.journal = certificate_lib.RegistrationJournal(
+                app_support_lib.get_support_dir(self.domain_id)
+                + certificate_lib.F_JOURNAL)
 
 
     def check_domain_id(self):
@@ -81,90 +109,165 @@ class Certifier:
             sys.exit(1)
 
 
+    def encode_subtree(self, subtree):
+
+        # Certificates under the same Merkle root share the directives near
+        # the root, so encoded directives are kept for reuse.
+        if len(self.directives) > MAX_DIRECTIVES:
+            self.directives.clear()
+
+        l = []
+        for directive in subtree:
+            key = (directive[b'position'], directive[b'digest'])
+            if key not in self.directives:
+                self.directives[key] = ('r-' if key[0] == b'right' else 'l-') \
+                        + key[1].decode('utf-8')
+            l.append(self.directives[key])
+
+        return ':'.join(l)
+
+
+    def get_ethereum(self, contract_address):
+
+        if contract_address in self.ethereums:
+            return self.ethereums[contract_address]
+
+        config = self.get_ethereum_config()
+
+        prevdir = os.getcwd()
+        os.chdir(bbc1.__path__[0] + '/core/ethereum')
+
+        eth = bbc_ethereum.BBcEthereum(
+            config['network'],
+            config['private_key'],
+            contract_address=contract_address
+        )
+
+        os.chdir(prevdir)
+
+        self.ethereums[contract_address] = eth
+        return eth
+
+
+    def get_ethereum_config(self):
+
+        if self.eth_config is None:
+            bbcConfig = bbc_config.BBcConfig(self.workingdir,
+                    os.path.join(self.workingdir,
+                    bbc_config.DEFAULT_CONFIG_FILE))
+            self.eth_config = bbcConfig.get_config()['ethereum']
+
+        return self.eth_config
+
+
     def get_registry(self):
         registry_id = self.dic[KEY_REGISTRY].user_id
         return registry_lib.BBcRegistry(self.domain_id, registry_id,
                 registry_id, self.idPubkeyMap)
 
 
-    def get_verification_dict(self, certificate):
+    def print_query_strings(self, certificates):
 
-        digest = hashlib.sha256(certificate.document.file()).digest()
+        digests, reasons = get_digests(certificates, self.digestCache)
 
-        self.client.verify_in_ledger_subsystem(None, digest)
-        dat = wait_check_result_msg_type(self.client.callback,
-                bbclib.MsgType.RESPONSE_VERIFY_HASH_IN_SUBSYS)
+        with self.stats.measure('core'):
+            dics = verify_digests(self.client, digests)
 
-        return dat[KeyType.merkle_tree]
+        for certificate, dic, reason in zip(certificates, dics, reasons):
+            if reason is None:
+                reason = get_failure_reason(dic)
 
+            if reason is not None:
+                self.print_result(certificate,
+                        ["Failed: {0}".format(reason)])
+                continue
 
-    def print_query_string(self, certificate):
+            qdic = {}
+            qdic['certificate'] = certificate.get_xml()
+            qdic['subtree'] = self.encode_subtree(dic[b'subtree'])
 
-        print("certificate id: {0}".format(certificate.id))
+            self.print_result(certificate, [urllib.parse.urlencode(qdic)])
 
-        if self.is_verbose:
-            print("xml: {0}".format(ET.tostring(certificate.document.root,
-                    encoding='utf-8').decode('utf-8')))
+        sys.stdout.flush()
 
-        dic = self.get_verification_dict(certificate)
 
-        if dic is None:
-            print("Failed: not registered.")
-            return
+    def print_result(self, certificate, lines):
 
-        if dic == {}:
-            print("Failed: ledger subsystem is not enabled.")
-            return
+        with self.stats.measure('output'):
+            self.count += 1
+            print("certificate id: {0}".format(certificate.id))
 
-        if dic[b'result'] == False:
-            print("Failed: document digest is not found.")
-            return
+            if self.is_verbose:
+                print("xml: {0}".format(certificate.get_xml()))
 
-        spec = dic[b'spec']
-        if spec[b'subsystem'] != b'ethereum':
-            print("Failed: not stored in an Ethereum subsystem.")
-            return
+            for line in lines:
+                print(line)
 
-        subtree = dic[b'subtree']
-        s = ''
-        for directive in subtree:
-            s += 'r-' if directive[b'position'] == b'right' else 'l-'
-            s += directive[b'digest'].decode('utf-8') + ':'
-        s = s[:-1]
 
-        qdic = {}
-        qdic['certificate'] = ET.tostring(certificate.document.root,
-                encoding='utf-8').decode('utf-8')
-        qdic['subtree'] = s
+    def register_batch(self, certificates):
 
-        print(urllib.parse.urlencode(qdic))
+        entries = []
+        digests = []
 
+        for certificate in certificates:
+            self.count += 1
+            print("certificate id: {0}".format(certificate.id))
 
-    def register(self, certificate):
+            document = certificate.document
 
-        print("certificate id: {0}".format(certificate.id))
+            if self.is_verbose:
+                print("xml: {0}".format(certificate.get_xml()))
 
-        document = certificate.document
+            if self.is_test:
+                continue
 
-        if self.is_verbose:
-            print("xml: {0}".format(ET.tostring(document.root,
-                    encoding='utf-8').decode('utf-8')))
-            print("registration to registry_lib.")
+            entry = (certificate.id,
+                    self.digestCache.get_digest(certificate))
+            state = self.journal.get_state(*entry)
+
+            if state == certificate_lib.STATE_DONE:
+                print("Skipped: already registered.")
+                self.num_skipped += 1
+                continue
+
+            if state is None:
+                if self.is_verbose:
+                    print("registration to registry_lib.")
 
-        if not self.is_test:
-            self.registry.register_document(self.dic[KEY_USER].user_id,
-                    document,
-                    registry_lib.DocumentSpec(description="certificate"),
-                    keypair=self.dic[KEY_REGISTRY].keypair)
+                with self.stats.measure('core'):
+                    self.registry.register_document(
+                            self.dic[KEY_USER].user_id, document,
+                            registry_lib.DocumentSpec(
+                            description="certificate"),
+                            keypair=self.dic[KEY_REGISTRY].keypair)
+                self.journal.set_states([entry],
+                        certificate_lib.STATE_DOCUMENT)
+
+            entries.append(entry)
+            digests.append(self.registry.get_document_digest(
+                    document.document_id))
 
         if self.is_verbose:
-            print("registration to ledger subsystem.")
+            print("registration of {0} digests to ledger subsystem.".format(
+                    len(digests)))
 
-        if not self.is_test:
-            self.client.register_in_ledger_subsystem(None,
-                    self.registry.get_document_digest(document.document_id))
-            dat = wait_check_result_msg_type(self.client.callback,
-                    bbclib.MsgType.RESPONSE_REGISTER_HASH_IN_SUBSYS)
+        if self.is_test:
+            return
+
+        with self.stats.measure('core'):
+            register_digests(self.client, digests)
+
+        self.journal.set_states(entries, certificate_lib.STATE_DONE)
+        self.num_registered += len(entries)
+
+        if not self.is_verbose:
+            return
+
+        elapsed = time.time() - self.start_time
+        print("Progress: {0} registered, {1} skipped ({2:.1f} certificates/s)"
+                .format(self.num_registered, self.num_skipped,
+                self.num_registered / elapsed if elapsed > 0 else 0),
+                file=sys.stderr)
 
 
     def run_client(self):
@@ -179,76 +282,96 @@ class Certifier:
         assert ret
 
 
-    def verify(self, certificate):
+    def start_run(self, is_test=False, is_verbose=False, digest_file=None,
+            is_profiling=False):
 
-        print("certificate id: {0}".format(certificate.id))
+        # Resets per-run states, so that a long-lived certifier (see serve())
+        # can process one command after another.
+        self.is_test = is_test
+        self.is_verbose = is_verbose
+        self.count = 0
+        self.stats = certificate_lib.Stats(is_enabled=is_profiling)
+        self.digestCache = certificate_lib.DigestCache(digest_file,
+                stats=self.stats)
 
-        if self.is_verbose:
-            print("xml: {0}".format(ET.tostring(certificate.document.root,
-                    encoding='utf-8').decode('utf-8')))
+        self.start_time = time.time()
+        self.num_registered = 0
+        self.num_skipped = 0
 
-        try:
-            dic = self.get_verification_dict(certificate)
 
-        except ValueError as error:
-            print("Failed: {0}".format(str(error)))
-            return
+    def verify_batch(self, certificates, jobs=1):
 
-        except KeyError as error:
-            print("Failed: algorithm {0} not supported".format(str(error)))
-            return
+        digests, reasons = get_digests(certificates, self.digestCache)
+        results = [None] * len(certificates)
 
-        if dic is None:
-            print("Failed: not registered.")
-            return
+        # Lookups at BBc-1 core, the registry and setting up of Ethereum are
+        # done here; only the calls to the chain go to the worker pool.
+        tasks = []
 
-        if dic == {}:
-            print("Failed: ledger subsystem is not enabled.")
-            return
+        with self.stats.measure('core'):
+            dics = verify_digests(self.client, digests)
 
-        if dic[b'result'] == False:
-            print("Failed: document digest is not found.")
-            return
+        for i, dic in enumerate(dics):
+            reason = reasons[i] if reasons[i] is not None \
+                    else get_failure_reason(dic)
+            if reason is not None:
+                results[i] = ["Failed: {0}".format(reason)]
+                continue
 
-        spec = dic[b'spec']
-        if spec[b'subsystem'] != b'ethereum':
-            print("Failed: not stored in an Ethereum subsystem.")
-            return
+            if self.is_test:
+                results[i] = []
+                continue
 
-        if self.is_test:
-            return
+            contract_address = \
+                    dic[b'spec'][b'contract_address'].decode('utf-8')
+            digest = self.registry.get_document_digest(
+                    certificates[i].document.document_id)
+            subtree = dic[b'subtree']
 
-        subtree = dic[b'subtree']
+            # Ethereum is set up only if there is a Merkle root that is not
+            # known to be anchored yet.
+            if self.chainCache.get_root_block_no(
+                    self.get_ethereum_config()['network'], contract_address,
+                    certificate_lib.fold_subtree(digest, subtree)) is None:
+                with self.stats.measure('ethereum'):
+                    self.get_ethereum(contract_address)
 
-        bbcConfig = bbc_config.BBcConfig(self.workingdir,
-                os.path.join(self.workingdir, bbc_config.DEFAULT_CONFIG_FILE))
-        config = bbcConfig.get_config()
+            tasks.append((i, contract_address, digest, subtree))
 
-        prevdir = os.getcwd()
-        os.chdir(bbc1.__path__[0] + '/core/ethereum')
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) \
+                as executor:
+            futures = [executor.submit(self.verify_in_ethereum,
+                    contract_address, digest, subtree)
+                    for i, contract_address, digest, subtree in tasks]
 
-        eth = bbc_ethereum.BBcEthereum(
-            config['ethereum']['network'],
-            config['ethereum']['private_key'],
-            contract_address=spec[b'contract_address'].decode('utf-8')
-        )
+            for task, future in zip(tasks, futures):
+                results[task[0]] = future.result()
 
-        os.chdir(prevdir)
+        for certificate, lines in zip(certificates, results):
+            self.print_result(certificate, lines)
 
-        digest = self.registry.get_document_digest(
-            certificate.document.document_id
-        )
 
-        block_no = eth.verify(digest, subtree)
+    def verify_in_ethereum(self, contract_address, digest, subtree):
+
+        network_name = self.get_ethereum_config()['network']
+
+        with self.stats.measure('ethereum'):
+            block_no, root = self.chainCache.verify(
+                    self.ethereums.get(contract_address), network_name,
+                    contract_address, digest, subtree)
+
+            if block_no > 0:
+                timestamp = self.chainCache.get_timestamp(network_name,
+                        block_no)
 
         if block_no <= 0:
-            print("Failed: document digest is not found.")
+            return ["Failed: document digest is not found."]
 
-        else:
-            block = network.web3.eth.getBlock(block_no)
-            print("Verified at: block {0}".format(block_no))
-            print("Date-Time: {0}".format(
-                    datetime.datetime.fromtimestamp(block['timestamp'])))
+        return [
+            "Verified at: block {0}".format(block_no),
+            "Date-Time: {0}".format(
+                    datetime.datetime.fromtimestamp(timestamp))
+        ]
 
 
 class User:
@@ -276,7 +399,7 @@ class User:
         })
 
 
-def argument_parser():
+def argument_parser(args=None):
     argparser = argparse.ArgumentParser()
     subparsers = argparser.add_subparsers(dest="command_type", help='commands')
 
@@ -285,6 +408,10 @@ def argument_parser():
             help='domain_id in hexadecimal')
     argparser.add_argument('-m', '--multiple', action='store_true',
             help='process multiple certificates in a file')
+    argparser.add_argument('-p', '--profile', '--stats', action='store_true',
+            help='print timing statistics at exit')
+    argparser.add_argument('-s', '--socket', type=str, default=None,
+            help='UNIX domain socket of the certifier daemon')
     argparser.add_argument('-t', '--test', action='store_true',
             help='does not register or verify')
     argparser.add_argument('-v', '--verbose', action='store_true',
@@ -300,39 +427,40 @@ def argument_parser():
     # query command
     parser = subparsers.add_parser('query',
             help='Generate verification query string(s)')
+    parser.add_argument('-b', '--batch_size', type=int, default=1,
+            help='number of certificates to look up per round trip')
+    parser.add_argument('-c', '--cache_digests', action='store_true',
+            help='save digests in [file_name].digests.sqlite and reuse them '
+            '(signatures are not verified again)')
     parser.add_argument('file_name', action='store', default=None,
             help='Certificate file name')
 
     # register command
     parser = subparsers.add_parser('register',
             help='Register certificate(s)')
+    parser.add_argument('-b', '--batch_size', type=int, default=1,
+            help='number of certificates to register per round trip')
+    parser.add_argument('-c', '--cache_digests', action='store_true',
+            help='save digests in [file_name].digests.sqlite and reuse them '
+            '(signatures are not verified again)')
     parser.add_argument('file_name', action='store', default=None,
             help='Certificate file name')
 
+    # serve command
+    parser = subparsers.add_parser('serve',
+            help='Run as a daemon taking commands from the socket or stdin')
+
     # verify command
     parser = subparsers.add_parser('verify',
             help='Verify certificate(s)')
+    parser.add_argument('-b', '--batch_size', type=int, default=1,
+            help='number of certificates to look up per round trip')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+            help='number of concurrent verifications at Ethereum')
     parser.add_argument('file_name', action='store', default=None,
             help='Certificate file name')
 
-    return argparser.parse_args()
-
-
-def create_certificates(file_name, process_multiple=False):
-
-    tree = ET.parse(file_name)
-    root = tree.getroot()
-
-    certs = []
-
-    if process_multiple:
-        for e in root:
-            certs.append(Certificate(e))
-
-    else:
-        certs.append(Certificate(root))
-
-    return certs
+    return argparser.parse_args(args)
 
 
 def create_new_domain():
@@ -359,6 +487,101 @@ def create_new_domain():
     write_dic(domain_id, dic)
 
 
+def forward_command(socket_path, args, file_name):
+
+    # The file name is made absolute as the daemon may run elsewhere.
+    args = list(args)
+    i = len(args) - 1 - args[::-1].index(file_name)
+    args[i] = os.path.abspath(file_name)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((' '.join(shlex.quote(arg) for arg in args)
+                + '\n').encode('utf-8'))
+
+        with sock.makefile('r', encoding='utf-8') as f:
+            for line in f:
+                sys.stdout.write(line)
+
+
+def get_batches(certs, batch_size):
+
+    batch = []
+
+    for certificate in certs:
+        batch.append(certificate)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if len(batch) > 0:
+        yield batch
+
+
+def get_digests(certificates, digestCache):
+
+    digests = []
+    reasons = []
+
+    for certificate in certificates:
+        try:
+            digests.append(digestCache.get_digest(certificate))
+            reasons.append(None)
+
+        except ValueError as error:
+            digests.append(None)
+            reasons.append(str(error))
+
+        except KeyError as error:
+            digests.append(None)
+            reasons.append("algorithm {0} not supported".format(str(error)))
+
+    return digests, reasons
+
+
+def get_failure_reason(dic):
+
+    if dic is None:
+        return "not registered."
+
+    if dic == {}:
+        return "ledger subsystem is not enabled."
+
+    if dic[b'result'] == False:
+        return "document digest is not found."
+
+    if dic[b'spec'][b'subsystem'] != b'ethereum':
+        return "not stored in an Ethereum subsystem."
+
+    return None
+
+
+def read_certificates(file_name, process_multiple=False):
+
+    if not process_multiple:
+        tree = ET.parse(file_name)
+        yield Certificate(tree.getroot())
+        return
+
+    # Certificates are yielded as soon as they are parsed, and detached from
+    # the top-level element afterwards, so that the whole file is never held
+    # in memory.
+    root = None
+    depth = 0
+
+    for event, e in ET.iterparse(file_name, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = e
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield Certificate(e)
+            root.clear()
+
+
 def read_dic(domain_id):
     dic = dict()
 
@@ -377,10 +600,163 @@ def read_dic(domain_id):
     return dic
 
 
+def register_digests(client, digests):
+
+    for digest in digests:
+        client.register_in_ledger_subsystem(None, digest)
+
+    for digest in digests:
+        wait_check_result_msg_type(client.callback,
+                bbclib.MsgType.RESPONSE_REGISTER_HASH_IN_SUBSYS)
+
+
+def run_command(certifier, parsed_args):
+
+    # Digests are reused over runs only if asked to, and never for
+    # verification, as a saved digest skips the check of the signature.
+    digest_file = None
+    if parsed_args.command_type != 'verify' and parsed_args.cache_digests:
+        digest_file = parsed_args.file_name + certificate_lib.EXT_DIGESTS
+
+    certifier.start_run(
+        is_test=parsed_args.test,
+        is_verbose=parsed_args.verbose,
+        digest_file=digest_file,
+        is_profiling=parsed_args.profile
+    )
+
+    certs = certifier.stats.iterate('parse', read_certificates(
+            parsed_args.file_name, process_multiple=parsed_args.multiple))
+
+    if parsed_args.command_type == "query":
+        for batch in get_batches(certs, parsed_args.batch_size):
+            certifier.print_query_strings(batch)
+
+    elif parsed_args.command_type == "register":
+        for batch in get_batches(certs, parsed_args.batch_size):
+            certifier.register_batch(batch)
+
+    elif parsed_args.command_type == "verify":
+        # A batch needs at least as many certificates as there are jobs.
+        batch_size = max(parsed_args.batch_size, parsed_args.jobs)
+        for batch in get_batches(certs, batch_size):
+            certifier.verify_batch(batch, jobs=parsed_args.jobs)
+
+    try:
+        certifier.digestCache.close()
+
+    except sqlite3.Error as error:
+        if certifier.is_verbose:
+            print("Digests not saved: {0}".format(str(error)))
+
+    if certifier.is_verbose:
+        print("Processed {0} certificates.".format(certifier.count))
+
+    certifier.stats.print_summary(certifier.count)
+
+
+def run_command_line(certifier, line):
+
+    try:
+        parsed_args = argument_parser(shlex.split(line))
+        sys_check(parsed_args)
+
+    except SystemExit:
+        # argparse has already printed the reason.
+        return
+
+    except Exception as e:
+        print(str(e))
+        return
+
+    if parsed_args.command_type not in ['query', 'register', 'verify']:
+        print("Error: {0} is not available in serve mode.".format(
+                parsed_args.command_type))
+        return
+
+    try:
+        run_command(certifier, parsed_args)
+
+    except Exception as e:
+        print("Error: {0}".format(str(e)))
+
+
+def serve(certifier, socket_path=None):
+
+    # Commands are taken one line at a time, in the same syntax as the command
+    # line of this program, with the connection to BBc-1 core, the registry
+    # and the caches kept open in between.
+    if socket_path is None:
+        for line in sys.stdin:
+            if len(line.strip()) > 0:
+                run_command_line(certifier, line)
+                sys.stdout.flush()
+        return
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+
+    try:
+        while True:
+            conn, address = server.accept()
+            conn.settimeout(SOCKET_TIMEOUT)
+
+            # A client that is silent or goes away only loses its own
+            # command; the daemon goes on to the next connection.
+            try:
+                with conn, conn.makefile('r', encoding='utf-8') as fin, \
+                        conn.makefile('w', encoding='utf-8') as fout, \
+                        contextlib.redirect_stdout(fout), \
+                        contextlib.redirect_stderr(fout):
+                    run_command_line(certifier, fin.readline())
+
+            except OSError as error:
+                print("Connection closed: {0}".format(str(error)),
+                        file=sys.stderr)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.close()
+        os.unlink(socket_path)
+
+
 def sys_check(args):
+    if getattr(args, 'batch_size', 1) < 1:
+        raise ValueError("Error: batch size must be a positive integer.")
+    if getattr(args, 'jobs', 1) < 1:
+        raise ValueError("Error: number of jobs must be a positive integer.")
     return
 
 
+def verify_digests(client, digests):
+
+    # All requests are sent before any response is awaited. Responses are
+    # matched to the requests by their query ids. None is returned for a
+    # digest that is None.
+    query_ids = []
+
+    for digest in digests:
+        query_ids.append(None if digest is None
+                else client.verify_in_ledger_subsystem(None, digest))
+
+    dics = {}
+
+    for query_id in query_ids:
+        if query_id is None:
+            continue
+        dat = wait_check_result_msg_type(client.callback,
+                bbclib.MsgType.RESPONSE_VERIFY_HASH_IN_SUBSYS)
+        dics[dat[KeyType.query_id]] = dat[KeyType.merkle_tree]
+
+    return [dics.get(query_id) for query_id in query_ids]
+
+
 def write_dic(domain_id, dic):
 
     j_dic = dict()
@@ -408,31 +784,22 @@ if __name__ == '__main__':
     if parsed_args.command_type == 'new_domain':
         create_new_domain()
 
+    elif parsed_args.socket is not None \
+            and parsed_args.command_type != 'serve':
+        forward_command(parsed_args.socket, sys.argv[1:],
+                parsed_args.file_name)
+
     else:
         certifier = Certifier(
-            is_test=parsed_args.test,
-            is_verbose=parsed_args.verbose,
             domain_id_string=parsed_args.domain_id,
             workingdir=parsed_args.workingdir
         )
 
-        certs = create_certificates(parsed_args.file_name,
-                process_multiple=parsed_args.multiple)
+        if parsed_args.command_type == 'serve':
+            serve(certifier, parsed_args.socket)
 
-        if certifier.is_verbose:
-            print("Processing {0} certificates.".format(len(certs)))
-
-        if parsed_args.command_type == "query":
-            for certificate in certs:
-                certifier.print_query_string(certificate)
-
-        elif parsed_args.command_type == "register":
-            for certificate in certs:
-                certifier.register(certificate)
-
-        elif parsed_args.command_type == "verify":
-            for certificate in certs:
-                certifier.verify(certificate)
+        else:
+            run_command(certifier, parsed_args)
 
     sys.exit(0)
 
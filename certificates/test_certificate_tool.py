@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import copy
+import subprocess
+import xml.etree.ElementTree as ET
+
+
+FLAT = '<c container="true"><id>1</id><g container="true"><x>1</x></g>' \
+        '<g container="true"><x>2</x></g></c>'
+
+NESTED = '<c container="true"><id>1</id><g container="true"><x>1</x>' \
+        '<h container="true"><y>2</y></h></g></c>'
+
+# containers below an element that is not a container
+BROKEN_CHAIN = '<c container="true"><p><g container="true">' \
+        '<s container="true"><x>1</x></s><y>2</y></g></p><q>3</q></c>'
+
+
+def get_digest(xml_string):
+    res = subprocess.check_output([
+        'python', 'certificate_tool.py', 'digest', xml_string
+    ])
+    return res.decode().strip()
+
+
+def get_digests(xml_string):
+    res = subprocess.check_output([
+        'python', 'certificate_tool.py', 'digest', '-a', xml_string
+    ])
+    return [line.split(' : ') for line in res.decode().splitlines()]
+
+
+def check_digests(xml_string, paths):
+    root = ET.fromstring(xml_string)
+    entries = get_digests(xml_string)
+
+    assert [path for path, digest in entries] == paths
+
+    for path, digest in entries:
+        e = root if path.count('/') <= 1 else root.find(path.split('/', 2)[2])
+        e = copy.deepcopy(e)
+        e.tail = None
+        assert digest == get_digest(ET.tostring(e, encoding='unicode'))
+
+
+def test_digest_all_flat():
+    check_digests(FLAT, ['/c', '/c/g[1]', '/c/g[2]'])
+
+
+def test_digest_all_nested():
+    check_digests(NESTED, ['/c', '/c/g', '/c/g/h'])
+
+
+def test_digest_all_broken_chain():
+    check_digests(BROKEN_CHAIN, ['/c', '/c/p/g', '/c/p/g/s'])
+
+
+# end of test_certificate_tool.py
@@ -19,9 +19,12 @@ import binascii
 import datetime
 import hashlib
 import json
+import logging
 import os
+import queue
 import string
 import sys
+import threading
 import time
 import xml.etree.ElementTree as ET
 
@@ -29,7 +32,6 @@ from bbc1.core import bbc_app, bbclib, bbc_config
 from bbc1.core.bbc_error import *
 from bbc1.core.ethereum import bbc_ethereum
 from bbc1.core.message_key_types import KeyType
-from bbc1.core.subsystem_tool_lib import wait_check_result_msg_type
 
 from bbc1.lib import id_lib, registry_lib
 from bbc1.lib.app_support_lib import Database, TransactionLabel
@@ -41,6 +43,51 @@ from flask import Blueprint, request, abort, jsonify, g, current_app
 
 NAME_OF_DB = 'certify_db'
 
+# Up to this many clients registered to bbc_core are kept for reuse, each
+# waiting for a response for up to this many seconds.
+CLIENT_POOL_SIZE = 8
+CLIENT_TIMEOUT = 30
+
+# Up to this many keypairs are generated in advance for /keypair.
+KEYPAIR_POOL_SIZE = 32
+
+# Up to this many documents can be registered at once with "_docs".
+MAX_DOCS = 1000
+
+# Digests registered through this API are indexed with their states, and
+# also kept in a Bloom filter in memory if enabled, of this many bits and
+# hash functions. Enable the filter only if a single process serves the
+# API, as each filter sees only registrations by its own process.
+USE_BLOOM_FILTER = False
+BLOOM_FILTER_BITS = 1 << 24
+BLOOM_FILTER_HASHES = 4
+
+# Digests not in the index are also looked up in the ledger subsystem before
+# registration, as documents registered before the index was introduced (or
+# by another instance of this API) are known only there. This costs a round
+# trip to bbc_core for each new digest; turning it off makes duplicate checks
+# local, which is right only if every document in the ledger subsystem has
+# been registered through the index of this database.
+CHECK_LEDGER = True
+
+STATE_PENDING = 'pending'  # registered, waiting for the Merkle root
+STATE_PROVEN  = 'proven'   # proof obtained
+
+# With CHECK_LEDGER, a digest pending for longer than these seconds, well
+# beyond the time the ledger subsystem takes to anchor a Merkle root, is
+# looked up in the ledger subsystem again, and can be registered again if not
+# found there (as the process may have stopped before sending it).
+PENDING_TIMEOUT = 24 * 60 * 60
+
+# Rows per statement when writing to the digest index.
+DIGEST_ROWS_PER_SQL = 256
+
+# Results of registration of each document in a batch.
+RESULT_NEW        = 'new'        # not registered yet
+RESULT_REGISTERED = 'registered'
+RESULT_DUPLICATE  = 'duplicate'  # appears earlier in the same batch
+RESULT_EXISTS     = 'exists'     # already registered
+
 
 certify_user_table_definition = [
     ["user_id", "BLOB"],
@@ -49,11 +96,29 @@ certify_user_table_definition = [
     ["private_key", "BLOB"],
 ]
 
+# Merkle proofs obtained from the ledger subsystem, which never change once
+# the Merkle root is anchored, kept for answering without bbc_core.
+certify_proof_table_definition = [
+    ["digest", "BLOB"],
+    ["spec", "TEXT"],
+    ["subtree", "TEXT"],
+]
+
+certify_digest_table_definition = [
+    ["digest", "BLOB"],
+    ["state", "TEXT"],
+    ["timestamp", "INTEGER"],
+]
+
 IDX_USER_ID = 0
 IDX_NAME    = 1
 IDX_PUBKEY  = 2
 IDX_PRIVKEY = 3
 
+IDX_DIGEST  = 0
+IDX_SPEC    = 1
+IDX_SUBTREE = 2
+
 # As a matter of convenience, we need two users: the registry and its user.
 NAME_REGISTRY = 'registry'
 NAME_USER     = 'user'
@@ -62,6 +127,140 @@ NAME_USER     = 'user'
 domain_id = bbclib.get_new_id("certify_web_domain", include_timestamp=False)
 
 
+# Digests seen, with false positives but no false negatives, so that most
+# digests never registered are told without looking up the index. As the
+# digests are SHA-256, the hash functions just take parts of them.
+class BloomFilter:
+
+    def __init__(self, bits=BLOOM_FILTER_BITS, hashes=BLOOM_FILTER_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+
+    def add(self, digest):
+        for i in self.get_positions(digest):
+            self.array[i >> 3] |= 1 << (i & 7)
+
+
+    def contains(self, digest):
+        return all(self.array[i >> 3] & (1 << (i & 7))
+                for i in self.get_positions(digest))
+
+
+    def get_positions(self, digest):
+        return [int.from_bytes(digest[i * 4:i * 4 + 4], 'little') % self.bits
+                for i in range(self.hashes)]
+
+
+# Clients registered to bbc_core, kept for reuse across requests. A client is
+# used by one request at a time, and waits for responses by query_id. Each
+# has its own user_id, as bbc_core sends a response to all connections of
+# the user_id. A client that fails to send or to get a response is dropped,
+# and a new one is made for the next request.
+class ClientPool:
+
+    def __init__(self, size=CLIENT_POOL_SIZE, timeout=CLIENT_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.clients = queue.LifoQueue()
+
+
+    def close(self, client):
+        try:
+            client.unregister_from_core()
+            client.connection.close()
+
+        except Exception:
+            pass
+
+
+    def get(self):
+        try:
+            return self.clients.get_nowait()
+
+        except queue.Empty:
+            return run_client()
+
+
+    def put(self, client):
+        if self.clients.qsize() >= self.size:
+            self.close(client)
+        else:
+            self.clients.put(client)
+
+
+    def register(self, digests):
+        return self.send('register_in_ledger_subsystem', digests)
+
+
+    def send(self, method_name, digests):
+        # All requests are sent before any response is awaited. Sending is
+        # retried once with a new client, as a pooled one may have been
+        # disconnected. Responses are returned in the order of the digests.
+        for i in range(2):
+            client = self.get()
+            query_ids = [getattr(client, method_name)(None, digest)
+                    for digest in digests]
+            if None not in query_ids:
+                break
+            self.close(client)
+
+        else:
+            abort_by_core_unavailable()
+
+        dats = []
+
+        try:
+            for query_id in query_ids:
+                dats.append(client.callback.get_from_queue(query_id,
+                        timeout=self.timeout))
+
+        except queue.Empty:
+            self.close(client)
+            abort_by_core_timeout()
+
+        self.put(client)
+        return dats
+
+
+    def verify(self, digests):
+        return self.send('verify_in_ledger_subsystem', digests)
+
+
+# Keypairs generated in advance by a background thread, which is started on
+# first use and refills the pool as keypairs are taken.
+class KeypairPool:
+
+    def __init__(self, size=KEYPAIR_POOL_SIZE):
+        self.keypairs = queue.Queue(maxsize=size)
+        self.thread = None
+        self.lock = threading.Lock()
+
+
+    def generate(self):
+        while True:
+            keypair = bbclib.KeyPair()
+            keypair.generate()
+            self.keypairs.put(keypair)
+
+
+    def get(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.generate,
+                        daemon=True)
+                self.thread.start()
+
+        try:
+            return self.keypairs.get_nowait()
+
+        except queue.Empty:
+            keypair = bbclib.KeyPair()
+            keypair.generate()
+            return keypair
+
+
 class User:
 
     def __init__(self, user_id, name, keypair):
@@ -81,6 +280,12 @@ class User:
 
 class Store:
 
+    # The proof and digest tables are made once per process, so that they
+    # also exist in databases set up before they were introduced. Digests of
+    # stored proofs are indexed then, and the Bloom filter is loaded.
+    lock = threading.Lock()
+    has_tables = False
+
     def __init__(self):
         self.db = Database()
         self.db.setup_db(domain_id, NAME_OF_DB)
@@ -93,6 +298,51 @@ class Store:
             pass
 
 
+    def delete_digests(self, digests):
+        self.setup_tables()
+        for digest in digests:
+            self.db.exec_sql(
+                domain_id,
+                NAME_OF_DB,
+                'delete from digest_table where digest=?',
+                digest
+            )
+
+
+    def read_digest_state(self, digest):
+        self.setup_tables()
+        if digest_filter is not None and not digest_filter.contains(digest):
+            return None
+        rows = self.db.exec_sql(
+            domain_id,
+            NAME_OF_DB,
+            'select state, timestamp from digest_table where digest=?',
+            digest
+        )
+        if len(rows) <= 0:
+            return None
+        state, timestamp = rows[0]
+        # An expired pending digest reads as not indexed only if it is then
+        # looked up in the ledger subsystem by find_in_ledger().
+        if CHECK_LEDGER and state == STATE_PENDING \
+                and timestamp < int(time.time()) - PENDING_TIMEOUT:
+            return None
+        return state
+
+
+    def read_proof(self, digest):
+        self.setup_tables()
+        rows = self.db.exec_sql(
+            domain_id,
+            NAME_OF_DB,
+            'select * from proof_table where digest=?',
+            digest
+        )
+        if len(rows) <= 0:
+            return None
+        return json.loads(rows[0][IDX_SPEC]), json.loads(rows[0][IDX_SUBTREE])
+
+
     def read_user(self, name):
         rows = self.db.exec_sql(
             domain_id,
@@ -109,6 +359,66 @@ class Store:
         self.db.create_table_in_db(domain_id, NAME_OF_DB, 'user_table',
                 certify_user_table_definition, primary_key=IDX_USER_ID,
                 indices=[IDX_NAME])
+        self.setup_tables()
+
+
+    def setup_tables(self):
+        with Store.lock:
+            if Store.has_tables:
+                return
+            self.db.create_table_in_db(domain_id, NAME_OF_DB, 'proof_table',
+                    certify_proof_table_definition, primary_key=IDX_DIGEST)
+            self.db.create_table_in_db(domain_id, NAME_OF_DB, 'digest_table',
+                    certify_digest_table_definition, primary_key=IDX_DIGEST)
+            self.db.exec_sql(
+                domain_id,
+                NAME_OF_DB,
+                'insert or ignore into digest_table '
+                'select digest, ?, ? from proof_table',
+                STATE_PROVEN,
+                int(time.time())
+            )
+
+            if digest_filter is not None:
+                for row in self.db.exec_sql(domain_id, NAME_OF_DB,
+                        'select digest from digest_table'):
+                    digest_filter.add(row[0])
+
+            Store.has_tables = True
+
+
+    def write_digest_states(self, digests, state):
+        self.setup_tables()
+        timestamp = int(time.time())
+
+        for i in range(0, len(digests), DIGEST_ROWS_PER_SQL):
+            chunk = digests[i:i + DIGEST_ROWS_PER_SQL]
+            args = []
+            for digest in chunk:
+                args.extend([digest, state, timestamp])
+            self.db.exec_sql(
+                domain_id,
+                NAME_OF_DB,
+                'insert or replace into digest_table values '
+                + ', '.join(['(?, ?, ?)'] * len(chunk)),
+                *args
+            )
+
+        if digest_filter is not None:
+            for digest in digests:
+                digest_filter.add(digest)
+
+
+    def write_proof(self, digest, spec, subtree):
+        self.setup_tables()
+        self.db.exec_sql(
+            domain_id,
+            NAME_OF_DB,
+            'insert or replace into proof_table values (?, ?, ?)',
+            digest,
+            json.dumps(spec),
+            json.dumps(subtree)
+        )
 
 
     def write_user(self, user):
@@ -123,6 +433,12 @@ class Store:
         )
 
 
+client_pool = ClientPool()
+keypair_pool = KeypairPool()
+digest_filter = BloomFilter() if USE_BLOOM_FILTER else None
+registration_lock = threading.Lock()
+
+
 def abort_by_bad_content_type(content_type):
     abort(400, description='Content-Type {0} is not expected'.format(
             content_type))
@@ -132,6 +448,18 @@ def abort_by_bad_json_format():
     abort(400, description='Bad JSON format')
 
 
+def abort_by_core_timeout():
+    abort(504, description='No response from bbc_core')
+
+
+def abort_by_core_unavailable():
+    abort(503, description='Cannot send a request to bbc_core')
+
+
+def abort_by_document_exists():
+    abort(409, description='Document already exists')
+
+
 def abort_by_merkle_root_not_found():
     abort(404, description='Merkle root not stored')
 
@@ -146,12 +474,19 @@ def abort_by_missing_param(param):
 
 def dict2xml(dic):
 
-    root = ET.fromstring('<c/>')
-    dict2xml_element(root, dic)
+    # Texts are collected for each element while converting, and joined at
+    # the end.
+    root = ET.Element('c')
+    texts = {}
+    dict2xml_element(root, dic, texts)
+
+    for element, values in texts.items():
+        element.text = ','.join(values)
 
     try:
-        current_app.logger.info('JSON to XML: {0}'.format(ET.tostring(root,
-                encoding='utf-8').decode()))
+        if current_app.logger.isEnabledFor(logging.INFO):
+            current_app.logger.info('JSON to XML: {0}'.format(ET.tostring(
+                    root, encoding='utf-8').decode()))
 
     except RuntimeError:
         pass
@@ -159,61 +494,124 @@ def dict2xml(dic):
     return root
 
 
-def dict2xml_element(element, value):
+def dict2xml_dict(element, value, texts):
 
-    if isinstance(value, dict):
-        element.set('container', 'true')
-        for k, v in value.items():
-            if k in ['proof', 'privkey']:
-                continue
+    element.set('container', 'true')
 
-            if k in ['algo', 'sig', 'pubkey']:
-                element.set(k, v)
-                continue
+    # first children by tag, made when a salt is found
+    tags = None
 
-            if k.startswith('digest'):
-                k = 'digest'
+    for k, v in value.items():
+        if k in {'proof', 'privkey'}:
+            continue
 
-            if k == 'salt' and isinstance(v, dict):
-                for kSalt, vSalt in v.items():
-                    e = element.find(kSalt)
-                    if e is not None:
-                        e.set(k, vSalt)
-                continue
+        if k in {'algo', 'sig', 'pubkey'}:
+            element.set(k, v)
+            continue
 
-            e = ET.SubElement(element, k)
-            dict2xml_element(e, v)
+        if k.startswith('digest'):
+            k = 'digest'
 
-    elif isinstance(value, list):
-        element.set('container', 'true')
-        for v in value:
-            dict2xml_element(element, v)
+        if k == 'salt' and isinstance(v, dict):
+            if tags is None:
+                tags = {}
+                for e in element:
+                    tags.setdefault(e.tag, e)
 
-    elif isinstance(value, bool):
-        if element.text is None:
-            element.text = str(value)
-        else:
-            element.text += ',' + str(value)
+            for kSalt, vSalt in v.items():
+                e = tags.get(kSalt)
+                if e is not None:
+                    e.set(k, vSalt)
+            continue
 
-    elif isinstance(value, int):
-        if element.text is None:
-            element.text = str(value)
+        e = ET.SubElement(element, k)
+        if tags is not None:
+            tags.setdefault(k, e)
+
+        # A new element has no other text.
+        if DICT2XML_CONVERTERS.get(type(v)) is dict2xml_text:
+            e.text = str(v)
         else:
-            element.text += ',' + str(value)
+            dict2xml_element(e, v, texts)
+
+
+def dict2xml_element(element, value, texts):
 
-    elif isinstance(value, str):
-        if element.text is None:
-            element.text = value
+    convert = DICT2XML_CONVERTERS.get(type(value))
+
+    if convert is None:
+        for t, f in DICT2XML_CONVERTERS.items():
+            if isinstance(value, t):
+                convert = f
+                break
         else:
-            element.text += ',' + value
+            return
+
+    convert(element, value, texts)
+
+
+def dict2xml_list(element, value, texts):
+
+    element.set('container', 'true')
+    for v in value:
+        dict2xml_element(element, v, texts)
+
+
+def dict2xml_text(element, value, texts):
+
+    texts.setdefault(element, []).append(str(value))
+
+
+# bool precedes int, of which it is a subclass.
+DICT2XML_CONVERTERS = {
+    dict: dict2xml_dict,
+    list: dict2xml_list,
+    bool: dict2xml_text,
+    int: dict2xml_text,
+    str: dict2xml_text,
+}
+
+
+def find_in_ledger(digests):
+    # Digests not in the index are looked up in the ledger subsystem, as a
+    # document may have been registered without going through the index.
+    # Those found are indexed as proven by get_proofs().
+    if not CHECK_LEDGER:
+        return
+
+    missing = [digest for digest in digests
+            if g.store.read_digest_state(digest) is None]
+
+    if len(missing) > 0:
+        get_proofs(missing)
 
 
 def get_document(request):
+    return get_document_from_dict(get_json(request))
+
+
+def get_document_digest(dic):
+    document = get_document_from_dict(dic)
+    return document.root.findtext('id', default='N/A'), \
+            hashlib.sha256(document.file()).digest()
+
+
+def get_document_from_dict(dic):
+    root = dict2xml(dic)
+
+    id = root.findtext('id', default='N/A')
+    return registry_lib.Document(
+        document_id=bbclib.get_new_id(id, include_timestamp=False),
+        root=root
+    )
+
+
+def get_json(request):
     if request.headers['Content-Type'] != 'application/json':
         abort_by_bad_content_type(request.headers['Content-Type'])
 
     try:
-        root = dict2xml(request.get_json())
+        return request.get_json()
 
     except Exception as e:
         s = str(e).split(':')
@@ -223,18 +621,128 @@ def get_document(request):
             s0 = s[0].split()
             abort(int(s0[0]), description=s[1].strip())
 
-    id = root.findtext('id', default='N/A')
-    return registry_lib.Document(
-        document_id=bbclib.get_new_id(id, include_timestamp=False),
-        root=root
-    )
+
+def get_proof_from_merkle_tree(dic):
+    if dic[b'result'] == False:
+        return None
+
+    spec_s = {}
+    subtree_s = []
+
+    for k, v in dic[b'spec'].items():
+        spec_s[k.decode()] = v.decode() if isinstance(v, bytes) else v
+
+    for node in dic[b'subtree']:
+        subtree_s.append({
+            'position': node[b'position'].decode(),
+            'digest': node[b'digest'].decode()
+        })
+
+    return spec_s, subtree_s
+
+
+def get_proofs(digests):
+    # Returns a list of (spec, subtree) for the digests, or None for a digest
+    # not found in the ledger subsystem. Proofs are looked up in the store
+    # first, and all the others are requested from bbc_core at once.
+    proofs = [g.store.read_proof(digest) for digest in digests]
+    missing = [digest for digest, proof in zip(digests, proofs)
+            if proof is None]
+
+    if len(missing) <= 0:
+        return proofs
+
+    found = {}
+    for digest, dat in zip(missing, client_pool.verify(missing)):
+        proof = get_proof_from_merkle_tree(dat[KeyType.merkle_tree])
+        if proof is not None:
+            g.store.write_proof(digest, *proof)
+            found[digest] = proof
+
+    if len(found) > 0:
+        g.store.write_digest_states(list(found.keys()), STATE_PROVEN)
+
+    return [found.get(digest) if proof is None else proof
+            for digest, proof in zip(digests, proofs)]
+
+
+def register_digests(digests):
+    # Digests are taken out of the index if they may not have been sent, so
+    # that they can be registered again.
+    try:
+        client_pool.register(digests)
+
+    except Exception:
+        g.store.delete_digests(digests)
+        raise
+
+
+def register_documents(docs):
+    if not isinstance(docs, list) or len(docs) <= 0:
+        abort_by_bad_json_format()
+    if len(docs) > MAX_DOCS:
+        abort(400, description='More than {0} documents'.format(MAX_DOCS))
+
+    entries = [get_document_digest(doc) for doc in docs]
+
+    # Duplicates are looked for in the batch and then in the digest index,
+    # which is filled from the ledger subsystem first.
+    results = []
+    digests = []
+    seen = set()
+
+    for i, (id, digest) in enumerate(entries):
+        results.append({
+            'index': i,
+            'id': id,
+            'digest': binascii.b2a_hex(digest).decode(),
+            'result': RESULT_NEW
+        })
+        if digest in seen:
+            results[-1]['result'] = RESULT_DUPLICATE
+        else:
+            digests.append(digest)
+            seen.add(digest)
+
+    find_in_ledger(digests)
+
+    with registration_lock:
+        for result, (id, digest) in zip(results, entries):
+            if result['result'] != RESULT_NEW:
+                continue
+            state = g.store.read_digest_state(digest)
+            if state is not None:
+                result['result'] = RESULT_EXISTS
+                result['state'] = state
+
+        # Nothing is registered if any of the documents is a duplicate.
+        if any(result['result'] != RESULT_NEW for result in results):
+            return jsonify({
+                'error': {
+                    'code': 409,
+                    'name': 'Conflict',
+                    'description': 'Document already exists',
+                },
+                'results': results
+            }), 409
+
+        g.store.write_digest_states(digests, STATE_PENDING)
+
+    register_digests(digests)
+
+    for result in results:
+        result['result'] = RESULT_REGISTERED
+
+    return jsonify({
+        'success': 'true',
+        'results': results
+    })
 
 
 def run_client():
     client = bbc_app.BBcAppClient(port=bbc_config.DEFAULT_CORE_PORT,
-            multiq=False, loglevel='all')
-    client.set_user_id(bbclib.get_new_id('examples.certify_web',
-            include_timestamp=False))
+            multiq=True, loglevel='all')
+    client.set_user_id(bbclib.get_new_id('examples.certify_web'))
     client.set_domain_id(domain_id)
     client.set_callback(bbc_app.Callback())
     ret = client.register_to_core()
@@ -253,8 +761,6 @@ def after_request(response):
         g.idPubkeyMap.close()
     if g.registry is not None:
         g.registry.close()
-    if g.client is not None:
-        g.client.unregister_from_core()
 
     return response
 
@@ -264,7 +770,6 @@ def before_request():
     g.store = Store()
     g.idPubkeyMap = None
     g.registry = None
-    g.client = None
 
 
 @api.route('/')
@@ -298,8 +803,7 @@ def get_digest():
 
 @api.route('/keypair', methods=['GET'])
 def get_keypair():
-    keypair = bbclib.KeyPair()
-    keypair.generate()
+    keypair = keypair_pool.get()
 
     return jsonify({
         'pubkey': binascii.b2a_hex(keypair.public_key).decode(),
@@ -313,34 +817,15 @@ def get_proof_for_document():
 
     digest = hashlib.sha256(document.file()).digest()
 
-    g.client = run_client()
+    proof = get_proofs([digest])[0]
 
-    g.client.verify_in_ledger_subsystem(None, digest)
-    dat = wait_check_result_msg_type(g.client.callback,
-            bbclib.MsgType.RESPONSE_VERIFY_HASH_IN_SUBSYS)
-
-    dic = dat[KeyType.merkle_tree]
-
-    if dic[b'result'] == False:
+    if proof is None:
         abort_by_merkle_root_not_found()
 
-    spec = dic[b'spec']
-    if spec[b'subsystem'] != b'ethereum':
-        abort_by_subsystem_not_supported()
-
-    subtree = dic[b'subtree']
-
-    spec_s = {}
-    subtree_s = []
+    spec_s, subtree_s = proof
 
-    for k, v in spec.items():
-        spec_s[k.decode()] = v.decode() if isinstance(v, bytes) else v
-
-    for node in subtree:
-        subtree_s.append({
-            'position': node[b'position'].decode(),
-            'digest': node[b'digest'].decode()
-        })
+    if spec_s['subsystem'] != 'ethereum':
+        abort_by_subsystem_not_supported()
 
     return jsonify({
         'proof': {
@@ -352,15 +837,23 @@ def get_proof_for_document():
 
 @api.route('/register', methods=['POST'])
 def register_document():
-    document = get_document(request)
+    dic = get_json(request)
+
+    if isinstance(dic, dict) and '_docs' in dic:
+        return register_documents(dic['_docs'])
+
+    document = get_document_from_dict(dic)
 
     digest = hashlib.sha256(document.file()).digest()
 
-    g.client = run_client()
+    find_in_ledger([digest])
+
+    with registration_lock:
+        if g.store.read_digest_state(digest) is not None:
+            abort_by_document_exists()
+        g.store.write_digest_states([digest], STATE_PENDING)
 
-    g.client.register_in_ledger_subsystem(None, digest)
-    dat = wait_check_result_msg_type(g.client.callback,
-            bbclib.MsgType.RESPONSE_REGISTER_HASH_IN_SUBSYS)
+    register_digests([digest])
 
     return jsonify({
         'success': 'true'
@@ -451,6 +944,8 @@ def verify_certificate():
 @api.errorhandler(400)
 @api.errorhandler(404)
 @api.errorhandler(409)
+@api.errorhandler(503)
+@api.errorhandler(504)
 def error_handler(e):
     return jsonify({'error': {
         'code': e.code,
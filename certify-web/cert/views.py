@@ -69,49 +69,15 @@ def build():
                         message=json.dumps(make_400_error('Bad JSON format'),
                         indent=2))
 
-        if '_docs' in dic:
-            docs = dic['_docs']
-
-            # check for duplication
-            for doc in docs:
-                r = requests.get(PREFIX_API + '/api/proof', headers=headers,
-                        data=json.dumps(doc, indent=2))
-                res = r.json()
-
-                if r.status_code == 200:
-                    return render_template('cert/error.html',
-                            message=json.dumps(make_400_error(
-                            'Document already exists'), indent=2))
-
-            # registration
-            for doc in docs:
-                r = requests.post(PREFIX_API + '/api/register',
-                        headers=headers, data=json.dumps(doc, indent=2))
-                res = r.json()
-
-                if r.status_code != 200:
-                    return render_template('cert/error.html',
-                            message=json.dumps(res, indent=2))
-
-        else:
-            # check for duplication
-            r = requests.get(PREFIX_API + '/api/proof', headers=headers,
-                    data=s.encode('utf-8'))
-            res = r.json()
-
-            if r.status_code == 200:
-                return render_template('cert/error.html',
-                        message=json.dumps(make_400_error(
-                        'Document already exists'), indent=2))
-
-            # registration
-            r = requests.post(PREFIX_API + '/api/register', headers=headers,
-                    data=s.encode('utf-8'))
-            res = r.json()
-
-            if r.status_code != 200:
-                return render_template('cert/error.html',
-                        message=json.dumps(res, indent=2))
+        # a single document or multiple ones with "_docs", of which
+        # duplication is checked upon registration
+        r = requests.post(PREFIX_API + '/api/register', headers=headers,
+                data=s.encode('utf-8'))
+        res = r.json()
+
+        if r.status_code != 200:
+            return render_template('cert/error.html',
+                    message=json.dumps(res, indent=2))
 
         return render_template('cert/results.html',
                 results=json.dumps(res, indent=2),